@@ -12,14 +12,29 @@ REFRESH_INTERVAL = 1800  # 30 minutes
 EMBEDDING_INDEX_PATH = "./faiss_index.index"
 METADATA_STORE_PATH = "./metadata_store.json"
 DATA_HASH_PATH = "./data_hash.txt"  # Store hash of data to detect changes
+EMBEDDINGS_CACHE_PATH = "./embeddings.npy"  # Raw embeddings, lets new records be appended without re-encoding
+EMBEDDING_SIGNATURE_PATH = "./embedding_model.txt"  # Model/backend that produced the saved vectors
 
 # Embedding model (paraphrase-MiniLM-L3-v2 is 2x faster, slightly lower quality but good enough)
 EMBEDDING_MODEL = "paraphrase-MiniLM-L3-v2"  # Faster alternative: "all-MiniLM-L6-v2"
+# Inference backend: "torch" (default) or "onnx" (2-4x faster on CPU, needs: pip install "sentence-transformers[onnx]")
+EMBEDDING_BACKEND = "torch"
+QUANTIZE_EMBEDDING_MODEL = True  # int8 dynamic quantization of the PyTorch model (~2x faster encode on CPU)
+ONNX_MODEL_FILE = None  # ONNX file in the model repo, e.g. "onnx/model_qint8_avx2.onnx" for int8 (None = onnx/model.onnx)
 
 # Performance settings
 LAZY_LOAD = True  # If True, skip initial indexing on startup (index on first query)
 BATCH_SIZE = 128  # Larger batch size for faster embedding generation
 NUM_WORKERS = 4  # Number of parallel workers for encoding
+QUERY_BATCH_WINDOW = 0.01  # Seconds to wait for concurrent /query requests to batch into one encode + search
+QUERY_BATCH_MAX = 32  # Maximum number of queries encoded in one batch
+QUERY_CACHE_SIZE = 512  # Number of query embeddings kept in memory (repeated questions skip the model)
+
+# FAISS index type (flat exhaustive search is fastest for small datasets)
+HNSW_THRESHOLD = 2000  # Use an HNSW graph index once the dataset reaches this many records
+HNSW_M = 32  # Neighbours per node in the HNSW graph
+HNSW_EF_CONSTRUCTION = 80  # Build-time search depth (higher = better graph, slower build)
+HNSW_EF_SEARCH = 32  # Query-time search depth (higher = better recall, slower search)
 
 # Ollama / local LLM settings
 OLLAMA_HOST = "http://127.0.0.1"  # Include protocol (http:// or https://)
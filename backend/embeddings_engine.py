@@ -6,49 +6,88 @@ import time
 import threading
 import logging
 import hashlib
+from collections import OrderedDict
 from typing import List, Dict, Optional
-from sentence_transformers import SentenceTransformer
-import numpy as np
-import faiss
 from config import (
     DATA_SOURCE_TYPE, DATA_PATH, API_URL,
-    EMBEDDING_INDEX_PATH, METADATA_STORE_PATH, DATA_HASH_PATH,
-    EMBEDDING_MODEL, REFRESH_INTERVAL, LAZY_LOAD, BATCH_SIZE, NUM_WORKERS
+    EMBEDDING_INDEX_PATH, METADATA_STORE_PATH, DATA_HASH_PATH, EMBEDDINGS_CACHE_PATH,
+    EMBEDDING_SIGNATURE_PATH,
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, ONNX_MODEL_FILE, QUANTIZE_EMBEDDING_MODEL,
+    REFRESH_INTERVAL, LAZY_LOAD, BATCH_SIZE, NUM_WORKERS, QUERY_CACHE_SIZE,
+    HNSW_THRESHOLD, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH
 )
+
+# Pin OpenMP/MKL thread pools before torch is imported (they are sized on first import)
+os.environ.setdefault("OMP_NUM_THREADS", str(NUM_WORKERS))
+os.environ.setdefault("MKL_NUM_THREADS", str(NUM_WORKERS))
+
+import torch
+from sentence_transformers import SentenceTransformer
+import numpy as np
+import faiss
+import orjson
 import requests
 
+# Inference only - no autograd bookkeeping needed
+torch.set_num_threads(NUM_WORKERS)
+torch.set_num_interop_threads(1)
+torch.set_grad_enabled(False)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Record fields used to build the embedding text (numeric ones are emitted as "key:value")
+TEXT_KEYS = ("software", "server", "location", "license")
+NUMERIC_KEYS = ("latest_license_issued", "license_day_peak", "license_day_average",
+                "license_work_peak", "license_work_average", "percentage_work_peak", "percentage_work_average")
+# Sentinel for absent numeric fields (a present None value is still emitted as "key:None")
+_MISSING = object()
+
 class EmbeddingEngine:
     def __init__(self):
         logger.info("Initializing EmbeddingEngine...")
 
+        # Let FAISS parallelize search/add across cores (some builds default to 1 thread)
+        faiss.omp_set_num_threads(NUM_WORKERS)
+        logger.info(f"FAISS using {faiss.omp_get_max_threads()} OpenMP threads")
+
         # Load model with optimized settings
-        logger.info(f"Loading embedding model: {EMBEDDING_MODEL}")
-        self.model = SentenceTransformer(EMBEDDING_MODEL)
+        logger.info(f"Loading embedding model: {EMBEDDING_MODEL} (backend: {EMBEDDING_BACKEND})")
+        self.model_signature = None  # set by _load_model to describe the model actually loaded
+        self.model = self._load_model()
 
         # Set number of workers for parallel encoding
         self.model.encode = self._wrap_encode(self.model.encode)
 
         self.index = None
         self.metadata = []  # list of records in same order as vectors
+        # (index, metadata) published together so lock-free readers see a consistent pair
+        self._snapshot = (None, [])
         self._initialized = False
-        self._lock = threading.Lock()  # For thread-safe operations
+        self._lock = threading.RLock()  # Serializes writers (build_index / add_records); readers don't take it
+
+        # LRU cache of normalized query embeddings (query text -> d-dim array)
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
 
         # Try to load existing index/metadata
         if os.path.exists(EMBEDDING_INDEX_PATH) and os.path.exists(METADATA_STORE_PATH):
             try:
                 logger.info("Loading existing index from disk...")
-                self.index = faiss.read_index(EMBEDDING_INDEX_PATH)
-                with open(METADATA_STORE_PATH, "r", encoding="utf-8") as f:
-                    self.metadata = json.load(f)
+                index = faiss.read_index(EMBEDDING_INDEX_PATH)
+                if index.metric_type != faiss.METRIC_INNER_PRODUCT:
+                    raise ValueError("index was built with L2 distance, rebuilding for cosine similarity")
+                if self._get_saved_signature() != self.model_signature:
+                    raise ValueError("index was built with a different embedding model, rebuilding")
+                self._configure_index(index)
+                with open(METADATA_STORE_PATH, "rb") as f:
+                    metadata = orjson.loads(f.read())
+                self._publish(index, metadata)
                 logger.info(f"✓ Loaded existing index ({len(self.metadata)} items) in seconds!")
                 self._initialized = True
             except Exception as e:
                 logger.error(f"Failed to load existing index: {e}")
-                self.index = None
-                self.metadata = []
+                self._publish(None, [])
 
         # Try initial load if no existing index and LAZY_LOAD is disabled
         if not self._initialized and not LAZY_LOAD:
@@ -69,16 +108,49 @@ class EmbeddingEngine:
         threading.Thread(target=self._auto_refresh_loop, daemon=True).start()
         logger.info("Auto-refresh thread started.")
 
+    def _load_model(self) -> SentenceTransformer:
+        """Load the embedding model, using ONNX Runtime if configured."""
+        if EMBEDDING_BACKEND == "onnx":
+            try:
+                import onnxruntime as ort
+                sess_options = ort.SessionOptions()
+                sess_options.intra_op_num_threads = NUM_WORKERS
+                model_kwargs = {"provider": "CPUExecutionProvider", "session_options": sess_options}
+                if ONNX_MODEL_FILE:
+                    model_kwargs["file_name"] = ONNX_MODEL_FILE
+                model = SentenceTransformer(EMBEDDING_MODEL, backend="onnx", model_kwargs=model_kwargs)
+                self.model_signature = f"{EMBEDDING_MODEL}|onnx|{ONNX_MODEL_FILE or 'default'}"
+                return model
+            except Exception as e:
+                logger.warning(f"ONNX backend unavailable ({e}), falling back to PyTorch")
+
+        model = SentenceTransformer(EMBEDDING_MODEL)
+        self.model_signature = f"{EMBEDDING_MODEL}|torch|fp32"
+        if QUANTIZE_EMBEDDING_MODEL:
+            try:
+                # Swap every Linear layer for an int8 kernel; weights are quantized once here
+                model[0].auto_model = torch.quantization.quantize_dynamic(
+                    model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                self.model_signature = f"{EMBEDDING_MODEL}|torch|int8"
+                logger.info("Applied int8 dynamic quantization to embedding model")
+            except Exception as e:
+                logger.warning(f"Model quantization failed ({e}), using FP32 model")
+        return model
+
     def _wrap_encode(self, original_encode):
         """Wrapper to add default parameters for faster encoding."""
         def encode_wrapper(sentences, **kwargs):
             # Set optimal defaults if not specified
             kwargs.setdefault('batch_size', BATCH_SIZE)
-            kwargs.setdefault('show_progress_bar', True)
+            kwargs.setdefault('show_progress_bar', False)
             kwargs.setdefault('convert_to_numpy', True)
+            # Unit-length output so inner product == cosine similarity (what SBERT models are trained for)
+            kwargs.setdefault('normalize_embeddings', True)
             # Note: num_workers is not supported in newer versions of sentence-transformers
             # Removed to avoid compatibility issues
-            return original_encode(sentences, **kwargs)
+            with torch.inference_mode():
+                return original_encode(sentences, **kwargs)
         return encode_wrapper
 
     def _load_records(self) -> List[Dict]:
@@ -88,8 +160,8 @@ class EmbeddingEngine:
                 logger.warning(f"Data file not found: {DATA_PATH}")
                 return []
             try:
-                with open(DATA_PATH, "r", encoding="utf-8") as f:
-                    records = json.load(f)
+                with open(DATA_PATH, "rb") as f:
+                    records = orjson.loads(f.read())
                 if not isinstance(records, list):
                     logger.error(f"Data file must contain a JSON array, got: {type(records)}")
                     return []
@@ -106,7 +178,7 @@ class EmbeddingEngine:
                 logger.info(f"Fetching data from API: {API_URL}")
                 r = requests.get(API_URL, timeout=30)
                 r.raise_for_status()
-                data = r.json()
+                data = orjson.loads(r.content)
                 if not isinstance(data, list):
                     logger.error(f"API must return a JSON array, got: {type(data)}")
                     return []
@@ -119,9 +191,12 @@ class EmbeddingEngine:
         return []
 
     def _compute_data_hash(self, records: List[Dict]) -> str:
-        """Compute hash of records to detect changes."""
-        data_str = json.dumps(records, sort_keys=True)
-        return hashlib.sha256(data_str.encode()).hexdigest()
+        """Compute hash of records to detect changes (streamed record by record)."""
+        h = hashlib.blake2b(digest_size=16)
+        for r in records:
+            h.update(orjson.dumps(r, option=orjson.OPT_SORT_KEYS))
+            h.update(b'\x00')
+        return h.hexdigest()
 
     def _get_saved_hash(self) -> Optional[str]:
         """Get previously saved data hash."""
@@ -141,6 +216,24 @@ class EmbeddingEngine:
         except Exception as e:
             logger.error(f"Failed to save data hash: {e}")
 
+    def _get_saved_signature(self) -> Optional[str]:
+        """Get the signature of the model that produced the saved index and embeddings."""
+        if os.path.exists(EMBEDDING_SIGNATURE_PATH):
+            try:
+                with open(EMBEDDING_SIGNATURE_PATH, "r") as f:
+                    return f.read().strip()
+            except Exception:
+                return None
+        return None
+
+    def _save_signature(self):
+        """Save the current model signature to file."""
+        try:
+            with open(EMBEDDING_SIGNATURE_PATH, "w") as f:
+                f.write(self.model_signature)
+        except Exception as e:
+            logger.error(f"Failed to save model signature: {e}")
+
     def build_index(self, records: List[Dict], force: bool = False) -> int:
         """
         Build FAISS index from records and save to disk.
@@ -156,8 +249,8 @@ class EmbeddingEngine:
             logger.warning("No records to index.")
             return 0
 
-        # Check if data has changed using hash
-        if not force:
+        # Check if data has changed using hash (only meaningful if an index is loaded)
+        if not force and self.index is not None:
             current_hash = self._compute_data_hash(records)
             saved_hash = self._get_saved_hash()
             if saved_hash == current_hash:
@@ -168,47 +261,158 @@ class EmbeddingEngine:
             logger.info(f"Building index for {len(records)} records...")
             start_time = time.time()
 
-            # Convert records to text (simple concatenation). Adjust as needed.
-            texts = [self._record_to_text(r) for r in records]
-
-            # Encode with optimized batch size and workers
-            logger.info(f"Encoding {len(texts)} texts (batch_size={BATCH_SIZE})...")
-            embeddings = self.model.encode(texts)
-            d = embeddings.shape[1]
+            # Encode with optimized batch size and workers (only changed records unless forced)
+            if force:
+                logger.info(f"Encoding {len(records)} texts (batch_size={BATCH_SIZE})...")
+                embeddings = self._encode_records(records)
+            else:
+                embeddings = self._embed_with_cache(records)
 
-            # Create FAISS index (consider using IndexIVFFlat for large datasets)
+            # Create FAISS index (flat for small datasets, HNSW graph for large ones)
             logger.info("Creating FAISS index...")
-            index = faiss.IndexFlatL2(d)
+            index = self._create_index(embeddings.shape[1], len(records))
             index.add(embeddings)
+            self._configure_index(index)
 
-            # Save to disk
-            try:
-                logger.info("Saving index to disk...")
-                faiss.write_index(index, EMBEDDING_INDEX_PATH)
-                with open(METADATA_STORE_PATH, "w", encoding="utf-8") as f:
-                    json.dump(records, f, indent=2)
-
-                # Save data hash
-                current_hash = self._compute_data_hash(records)
-                self._save_hash(current_hash)
-
-                logger.info(f"✓ Index saved to {EMBEDDING_INDEX_PATH}")
-            except Exception as e:
-                logger.error(f"Failed to save index: {e}")
-                raise
+            self._save_index(index, records, embeddings)
 
-            self.index = index
-            self.metadata = records
+            self._publish(index, records)
 
             elapsed = time.time() - start_time
             logger.info(f"✓ Built index for {len(records)} records in {elapsed:.2f}s ({len(records)/elapsed:.1f} records/sec)")
             return len(records)
 
+    def _publish(self, index, metadata: List[Dict]):
+        """Swap in a new index/metadata pair; never mutate a published index or list."""
+        self._snapshot = (index, metadata)
+        self.index = index
+        self.metadata = metadata
+
+    def _encode_records(self, records: List[Dict]) -> np.ndarray:
+        """Encode records into L2-normalized float32 embeddings (normalized inside encode)."""
+        # Convert records to text (simple concatenation). Adjust as needed.
+        texts = [self._record_to_text(r) for r in records]
+        # Encode in length order so each batch pads to similar lengths, then restore record order
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        sorted_embeddings = self.model.encode([texts[i] for i in order], convert_to_numpy=True,
+                                              show_progress_bar=True)
+        embeddings = np.empty_like(sorted_embeddings, dtype=np.float32)
+        embeddings[order] = sorted_embeddings
+        return embeddings
+
+    def _record_key(self, r: Dict) -> bytes:
+        """Stable identity of a record's content, used to match records across refreshes."""
+        return orjson.dumps(r, option=orjson.OPT_SORT_KEYS)
+
+    def _embed_with_cache(self, records: List[Dict]) -> np.ndarray:
+        """Embed records, reusing cached embeddings of records that are already indexed."""
+        cached = self._load_cached_embeddings() if self.index is not None else None
+        if cached is None:
+            logger.info(f"Encoding {len(records)} texts (batch_size={BATCH_SIZE})...")
+            return self._encode_records(records)
+
+        known = {}
+        for i, r in enumerate(self.metadata):
+            known.setdefault(self._record_key(r), i)
+        rows = np.fromiter((known.get(self._record_key(r), -1) for r in records),
+                           dtype=np.int64, count=len(records))
+
+        embeddings = np.empty((len(records), cached.shape[1]), dtype=np.float32)
+        reused = rows >= 0
+        embeddings[reused] = cached[rows[reused]]
+        new_rows = np.flatnonzero(~reused)
+        logger.info(f"Reusing {len(records) - new_rows.size} cached embeddings, "
+                    f"encoding {new_rows.size} new/changed records (batch_size={BATCH_SIZE})...")
+        if new_rows.size:
+            embeddings[new_rows] = self._encode_records([records[i] for i in new_rows])
+        return embeddings
+
+    def _create_index(self, d: int, n: int):
+        """Create an empty FAISS index suited to the dataset size."""
+        if n < HNSW_THRESHOLD:
+            return faiss.IndexFlatIP(d)
+        logger.info(f"Using HNSW index (M={HNSW_M}) for {n} records")
+        index = faiss.IndexHNSWFlat(d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+
+    def _configure_index(self, index):
+        """Apply query-time settings (not all of them survive write_index/read_index)."""
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    def _save_index(self, index, records: List[Dict], embeddings: np.ndarray):
+        """Persist index, embeddings, metadata and data hash to disk."""
+        try:
+            logger.info("Saving index to disk...")
+            faiss.write_index(index, EMBEDDING_INDEX_PATH)
+            np.save(EMBEDDINGS_CACHE_PATH, embeddings)
+            self._save_signature()
+            # Compact binary write - the store is machine-read only
+            with open(METADATA_STORE_PATH, "wb") as f:
+                f.write(orjson.dumps(records))
+
+            # Save data hash
+            current_hash = self._compute_data_hash(records)
+            self._save_hash(current_hash)
+
+            logger.info(f"✓ Index saved to {EMBEDDING_INDEX_PATH}")
+        except Exception as e:
+            logger.error(f"Failed to save index: {e}")
+            raise
+
+    def _load_cached_embeddings(self) -> Optional[np.ndarray]:
+        """Load saved embeddings if they line up with the current metadata and model."""
+        if not os.path.exists(EMBEDDINGS_CACHE_PATH):
+            return None
+        # Vectors from another model (or backend/quantization) must never be mixed into the index
+        if self._get_saved_signature() != self.model_signature:
+            logger.warning("Cached embeddings were produced by a different model, ignoring them.")
+            return None
+        try:
+            # Memory-mapped: only the rows that are actually copied get paged in
+            embeddings = np.load(EMBEDDINGS_CACHE_PATH, mmap_mode='r')
+        except Exception as e:
+            logger.error(f"Failed to load cached embeddings: {e}")
+            return None
+        if embeddings.shape[0] != len(self.metadata):
+            logger.warning("Cached embeddings are out of sync with metadata, ignoring them.")
+            return None
+        return embeddings
+
     def add_records(self, new_records: List[Dict]) -> int:
-        """Append new records to index (simple rebuild pattern for reliability)."""
+        """Append new records to index, encoding only the new records."""
         logger.info(f"Adding {len(new_records)} new records...")
-        all_records = self.metadata + new_records
-        return self.build_index(all_records)
+        if not new_records:
+            return len(self.metadata)
+
+        with self._lock:
+            cached = self._load_cached_embeddings() if self.index is not None else None
+            if cached is not None:
+                new_embeddings = self._encode_records(new_records)
+                embeddings = np.vstack([cached, new_embeddings])
+                del cached  # release the memory map before embeddings.npy is rewritten
+                all_records = self.metadata + new_records
+
+                # Grow a copy of the current index (readers may be searching the live one)
+                # unless the size crossed the HNSW threshold
+                if isinstance(self.index, faiss.IndexHNSW) == (len(all_records) >= HNSW_THRESHOLD):
+                    index = faiss.clone_index(self.index)
+                    self._configure_index(index)
+                    index.add(new_embeddings)
+                else:
+                    index = self._create_index(embeddings.shape[1], len(all_records))
+                    index.add(embeddings)
+                    self._configure_index(index)
+
+                self._save_index(index, all_records, embeddings)
+                self._publish(index, all_records)
+                logger.info(f"✓ Appended {len(new_records)} records ({len(all_records)} total)")
+                return len(all_records)
+
+        # No usable embedding cache - fall back to a full rebuild
+        logger.info("Embedding cache unavailable, rebuilding full index...")
+        return self.build_index(self.metadata + new_records)
 
     def refresh_from_source(self) -> int:
         """Load data from source and rebuild index if changed."""
@@ -221,20 +425,17 @@ class EmbeddingEngine:
 
     def _record_to_text(self, r: Dict) -> str:
         # Concatenate important fields into a summary string used for embedding
-        parts = []
-        for k in ["software", "server", "location", "license"]:
-            if k in r and r[k] is not None:
-                parts.append(str(r[k]))
+        parts = [str(v) for k in TEXT_KEYS if (v := r.get(k)) is not None]
         # Add numeric fields too for context
-        numeric_keys = ["latest_license_issued", "license_day_peak", "license_day_average",
-                        "license_work_peak", "license_work_average", "percentage_work_peak", "percentage_work_average"]
-        for k in numeric_keys:
-            if k in r:
-                parts.append(f"{k}:{r[k]}")
+        parts.extend([f"{k}:{v}" for k in NUMERIC_KEYS if (v := r.get(k, _MISSING)) is not _MISSING])
         return " | ".join(parts)
 
     def query(self, q: str, k: int = 6) -> List[Dict]:
         """Query the index for similar records. Lazily builds index if needed."""
+        return self.query_batch([q], k)[0]
+
+    def query_batch(self, queries: List[str], k: int = 6) -> List[List[Dict]]:
+        """Query the index for several queries with a single encode and search call."""
         # Lazy load: build index if not initialized and LAZY_LOAD is enabled
         if not self._initialized and LAZY_LOAD:
             logger.info("First query received - building index now (lazy load)...")
@@ -245,29 +446,50 @@ class EmbeddingEngine:
                     logger.info(f"✓ Index built with {count} records.")
                 else:
                     logger.warning("No data available for indexing.")
-                    return []
+                    return [[] for _ in queries]
             except Exception as e:
                 logger.error(f"Lazy index build failed: {e}")
-                return []
+                return [[] for _ in queries]
 
-        if self.index is None or len(self.metadata) == 0:
+        # FAISS CPU search and model encode are safe for concurrent readers, so no lock here
+        index, metadata = self._snapshot
+        if index is None or len(metadata) == 0:
             logger.warning("Index is empty, cannot query.")
-            return []
+            return [[] for _ in queries]
 
-        with self._lock:
-            q_emb = self.model.encode([q])
-            # Ensure k doesn't exceed number of indexed items
-            k = min(k, len(self.metadata))
-            D, I = self.index.search(q_emb, k)
+        q_emb = self._encode_queries(queries)
+        # Ensure k doesn't exceed number of indexed items
+        k = min(k, len(metadata))
+        D, I = index.search(q_emb, k)
 
-            results = []
-            for idx in I[0]:
-                if 0 <= idx < len(self.metadata):
-                    results.append(self.metadata[idx])
+        results = [[metadata[idx] for idx in row if 0 <= idx < len(metadata)] for row in I]
 
-        logger.info(f"Query returned {len(results)} results.")
+        logger.info(f"Query batch of {len(queries)} returned {sum(len(r) for r in results)} results.")
         return results
 
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode and normalize queries, reusing cached embeddings for repeated queries."""
+        with self._query_cache_lock:
+            cached = {}
+            for q in queries:
+                q_emb = self._query_cache.get(q)
+                if q_emb is not None:
+                    self._query_cache.move_to_end(q)
+                    cached[q] = q_emb
+
+        # Encode all cache misses together in one forward pass
+        misses = list(dict.fromkeys(q for q in queries if q not in cached))
+        if misses:
+            new_emb = np.ascontiguousarray(self.model.encode(misses), dtype=np.float32)
+            with self._query_cache_lock:
+                for q, q_emb in zip(misses, new_emb):
+                    cached[q] = q_emb
+                    self._query_cache[q] = q_emb
+                while len(self._query_cache) > QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+
+        return np.ascontiguousarray(np.stack([cached[q] for q in queries]))
+
     def _auto_refresh_loop(self):
         """Background thread that periodically refreshes the index from source."""
         logger.info(f"Auto-refresh loop started (interval: {REFRESH_INTERVAL}s)")
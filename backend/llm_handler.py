@@ -1,12 +1,13 @@
 # backend/llm_handler.py
 
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import asyncio
+import httpx
 import json
+import hashlib
 import logging
-import time
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
 from config import OLLAMA_HOST, OLLAMA_PORT, MODEL_NAME
 
 logging.basicConfig(level=logging.INFO)
@@ -14,76 +15,126 @@ logger = logging.getLogger(__name__)
 
 OLLAMA_API = f"{OLLAMA_HOST}:{OLLAMA_PORT}/api/generate"
 
-# Create a lock to prevent concurrent Ollama requests (Windows Ollama bug)
-import threading
-_ollama_lock = threading.Lock()
-
-# Create a session with connection pooling and keep-alive
-def create_session():
-    """Create a requests session with proper retry and connection handling."""
-    session = requests.Session()
-
-    # Configure retry strategy
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["POST"]
-    )
-
-    adapter = HTTPAdapter(
-        max_retries=retry_strategy,
-        pool_connections=1,
-        pool_maxsize=1,
-        pool_block=False
+# Lock to prevent concurrent Ollama requests (Windows Ollama bug).
+# Created lazily so it binds to the server's running event loop.
+_ollama_lock: Optional[asyncio.Lock] = None
+
+def _get_ollama_lock() -> asyncio.Lock:
+    global _ollama_lock
+    if _ollama_lock is None:
+        _ollama_lock = asyncio.Lock()
+    return _ollama_lock
+
+# HTTP status codes worth retrying (Ollama busy / restarting)
+_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Create an async client with connection pooling and keep-alive
+def create_client() -> httpx.AsyncClient:
+    """Create an async HTTP client with keep-alive and connection retries."""
+    return httpx.AsyncClient(
+        timeout=180,
+        limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+        # Retries failed connection attempts; status-code retries are handled in query_llm
+        transport=httpx.AsyncHTTPTransport(retries=3),
+        headers={
+            'Connection': 'keep-alive',
+            'Content-Type': 'application/json'
+        }
     )
 
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
+# Global client (reused across requests)
+_client = create_client()
 
-    # Set default headers
-    session.headers.update({
-        'Connection': 'keep-alive',
-        'Content-Type': 'application/json'
-    })
-
-    return session
-
-# Global session (reused across requests)
-_session = create_session()
-
-# Simple in-memory cache for responses (LRU-style with max 100 entries)
-_response_cache = {}
+async def _reset_client(failed_client: Optional[httpx.AsyncClient]):
+    """
+    Replace the global client after a connection error.
+    Runs under the Ollama lock so no request is in flight on the client being closed,
+    and does nothing if another request has already replaced it.
+    """
+    global _client
+    async with _get_ollama_lock():
+        if _client is not failed_client:
+            return
+        _client = create_client()
+        await failed_client.aclose()
+
+# In-memory LRU cache for responses (max 100 entries)
+_response_cache = OrderedDict()
 _cache_max_size = 100
+_cache_lock = threading.Lock()
 
 def _get_cache_key(prompt: str) -> str:
     """Generate a cache key from the prompt."""
-    import hashlib
-    return hashlib.md5(prompt.encode()).hexdigest()
+    return hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
 
 def _get_cached_response(prompt: str) -> Optional[str]:
     """Get cached response if available."""
     key = _get_cache_key(prompt)
-    if key in _response_cache:
+    with _cache_lock:
+        response = _response_cache.get(key)
+        if response is not None:
+            _response_cache.move_to_end(key)
+    if response is not None:
         logger.info("Cache hit! Returning cached response")
-        return _response_cache[key]
-    return None
+    return response
 
 def _cache_response(prompt: str, response: str):
     """Cache a response with LRU eviction."""
-    global _response_cache
     key = _get_cache_key(prompt)
+    with _cache_lock:
+        _response_cache[key] = response
+        _response_cache.move_to_end(key)
+        # Evict least recently used entry if cache is full
+        if len(_response_cache) > _cache_max_size:
+            _response_cache.popitem(last=False)
+
+def _build_payload(prompt: str, max_tokens: int, temperature: float, stream: bool) -> dict:
+    """Build the Ollama /api/generate request body."""
+    return {
+        "model": MODEL_NAME,
+        "prompt": prompt,
+        "stream": stream,  # False = get complete response at once
+        "keep_alive": "10m",  # Keep model loaded for 10 minutes (prevents unload/reload)
+        "options": {
+            "temperature": temperature,
+            "num_predict": max_tokens,
+            "num_ctx": 1024,  # Reduced context window for faster processing (from default 2048)
+            "top_k": 20,  # Faster sampling
+            "top_p": 0.9,  # Nucleus sampling for speed
+        }
+    }
 
-    # Simple LRU: if cache is full, remove oldest (first) entry
-    if len(_response_cache) >= _cache_max_size:
-        _response_cache.pop(next(iter(_response_cache)))
-
-    _response_cache[key] = response
+async def warmup_llm(timeout: float = 60) -> bool:
+    """
+    Load the model into Ollama's memory with a single empty-prompt request.
+    Called once on startup so the first user query doesn't pay the model load time.
 
-def query_llm(prompt: str, max_tokens: int = 100, temperature: float = 0.7, retry_count: int = 5) -> str:
+    Returns:
+        True if Ollama loaded the model, False otherwise
+    """
+    payload = {
+        "model": MODEL_NAME,
+        "prompt": "",  # Empty prompt only loads the model
+        "stream": False,
+        "keep_alive": "30m",
+        "options": {"num_predict": 1}
+    }
+    try:
+        async with _get_ollama_lock():
+            logger.info(f"Warming up Ollama model {MODEL_NAME}...")
+            response = await _client.post(OLLAMA_API, json=payload, timeout=timeout)
+            response.raise_for_status()
+        logger.info("✓ Ollama model loaded")
+        return True
+    except httpx.HTTPError as e:
+        logger.warning(f"Ollama warmup failed ({type(e).__name__}: {e}), model will load on first query")
+        return False
+
+async def query_llm(prompt: str, max_tokens: int = 100, temperature: float = 0.7, retry_count: int = 5) -> str:
     """
     Calls Ollama local HTTP API to generate a completion.
     Uses the correct Ollama API format with proper parameter names.
+    Awaits the HTTP call so the event loop keeps serving other requests meanwhile.
 
     Args:
         prompt: The prompt to send to the LLM
@@ -94,42 +145,24 @@ def query_llm(prompt: str, max_tokens: int = 100, temperature: float = 0.7, retr
     Returns:
         The generated text response from the LLM
     """
-    global _session  # Declare at the beginning of function
-
     # Check cache first for instant responses
     cached = _get_cached_response(prompt)
     if cached:
         return cached
 
-    payload = {
-        "model": MODEL_NAME,
-        "prompt": prompt,
-        "stream": False,  # Get complete response at once
-        "keep_alive": "10m",  # Keep model loaded for 10 minutes (prevents unload/reload)
-        "options": {
-            "temperature": temperature,
-            "num_predict": max_tokens,
-            "num_ctx": 1024,  # Reduced context window for faster processing (from default 2048)
-            "top_k": 20,  # Faster sampling
-            "top_p": 0.9,  # Nucleus sampling for speed
-        }
-    }
+    payload = _build_payload(prompt, max_tokens, temperature, stream=False)
 
     # Retry logic for connection issues
     for attempt in range(retry_count):
-        response = None
+        client = None
         try:
             # Acquire lock to prevent concurrent requests (Ollama Windows bug)
-            with _ollama_lock:
+            async with _get_ollama_lock():
                 logger.info(f"Sending request to Ollama API (attempt {attempt + 1}/{retry_count})")
 
-                # Use persistent session with connection pooling
-                response = _session.post(
-                    OLLAMA_API,
-                    json=payload,
-                    timeout=180,
-                    stream=False
-                )
+                # Use persistent client with connection pooling
+                client = _client
+                response = await client.post(OLLAMA_API, json=payload)
                 response.raise_for_status()
 
                 # Parse the response INSIDE the lock to avoid connection issues
@@ -151,32 +184,36 @@ def query_llm(prompt: str, max_tokens: int = 100, temperature: float = 0.7, retr
                 logger.warning(f"Unexpected Ollama response format: {data}")
                 return f"[Unexpected response format] {json.dumps(data)}"
 
-        except (requests.exceptions.ConnectionError, ConnectionResetError, requests.exceptions.ChunkedEncodingError) as e:
+        except httpx.TimeoutException as e:
+            logger.error(f"Timeout on attempt {attempt + 1}")
+            if attempt < retry_count - 1:
+                logger.info(f"Retrying after timeout...")
+                await asyncio.sleep(2)
+                continue
+            else:
+                error_msg = "Request to Ollama timed out after multiple attempts."
+                logger.error(error_msg)
+                return f"[LLM Timeout Error] {error_msg}"
+
+        except (httpx.NetworkError, httpx.RemoteProtocolError, ConnectionResetError) as e:
             logger.warning(f"Connection error on attempt {attempt + 1}: {type(e).__name__}: {str(e)}")
             if attempt < retry_count - 1:
                 wait_time = 1 + (attempt * 1)  # Backoff: 1s, 2s, 3s, 4s, 5s
                 logger.info(f"Auto-retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-                # Recreate session on connection error
-                _session = create_session()
+                await asyncio.sleep(wait_time)
+                # Recreate client on connection error
+                await _reset_client(client)
                 continue
             else:
                 error_msg = f"Connection to Ollama failed after {retry_count} attempts. Make sure Ollama is running."
                 logger.error(error_msg)
                 return f"[LLM Connection Error] {error_msg}"
 
-        except requests.exceptions.Timeout as e:
-            logger.error(f"Timeout on attempt {attempt + 1}")
-            if attempt < retry_count - 1:
-                logger.info(f"Retrying after timeout...")
-                time.sleep(2)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in _RETRY_STATUS_CODES and attempt < retry_count - 1:
+                logger.warning(f"Ollama returned {e.response.status_code}, retrying...")
+                await asyncio.sleep(1 + attempt)
                 continue
-            else:
-                error_msg = "Request to Ollama timed out after multiple attempts."
-                logger.error(error_msg)
-                return f"[LLM Timeout Error] {error_msg}"
-
-        except requests.exceptions.HTTPError as e:
             error_msg = f"HTTP error from Ollama: {e.response.status_code} - {e.response.text}"
             logger.error(error_msg)
             return f"[LLM HTTP Error] {error_msg}"
@@ -185,20 +222,72 @@ def query_llm(prompt: str, max_tokens: int = 100, temperature: float = 0.7, retr
             logger.error(f"Failed to parse JSON response: {e}")
             if attempt < retry_count - 1:
                 logger.info(f"Retrying after JSON decode error...")
-                time.sleep(1)
+                await asyncio.sleep(1)
                 continue
             return f"[LLM Error] Invalid JSON response from Ollama"
 
         except Exception as e:
             logger.error(f"Unexpected error querying LLM: {type(e).__name__}: {e}")
             if attempt < retry_count - 1:
-                time.sleep(1)
+                await asyncio.sleep(1)
                 continue
             return f"[LLM Error] {type(e).__name__}: {e}"
 
-        finally:
-            # Ensure response is closed properly
-            if response is not None:
-                response.close()
-
     return "[LLM Error] Max retries exceeded"
+
+async def query_llm_stream(prompt: str, max_tokens: int = 100, temperature: float = 0.7) -> AsyncIterator[str]:
+    """
+    Stream a completion from Ollama chunk by chunk as tokens are generated.
+
+    If the stream fails before any text was produced, falls back to query_llm
+    (which has the full retry logic). The joined text is cached once the stream completes.
+
+    Args:
+        prompt: The prompt to send to the LLM
+        max_tokens: Maximum number of tokens to generate (mapped to num_predict)
+        temperature: Temperature for generation (0.0 = deterministic)
+
+    Yields:
+        Text chunks of the generated response
+    """
+    cached = _get_cached_response(prompt)
+    if cached:
+        yield cached
+        return
+
+    payload = _build_payload(prompt, max_tokens, temperature, stream=True)
+    chunks = []
+    done = False
+    try:
+        async with _get_ollama_lock():
+            logger.info("Sending streaming request to Ollama API")
+            async with _client.stream("POST", OLLAMA_API, json=payload) as response:
+                response.raise_for_status()
+                # Ollama streams one JSON object per line: {"response": "...", "done": false}
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    chunk = data.get("response", "")
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+                    if data.get("done"):
+                        done = True
+                        break
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
+        logger.warning(f"Streaming request failed: {type(e).__name__}: {e}")
+        if chunks:
+            yield "\n[LLM Error] Response stream was interrupted"
+            return
+        logger.info("Falling back to non-streaming request...")
+        yield await query_llm(prompt, max_tokens=max_tokens, temperature=temperature)
+        return
+
+    response_text = "".join(chunks).strip()
+    if not response_text:
+        logger.warning("Received empty response from Ollama")
+        yield "[Empty response from LLM]"
+    elif done:
+        logger.info("Successfully streamed response from Ollama")
+        _cache_response(prompt, response_text)
@@ -2,23 +2,26 @@
 
 import uvicorn
 from fastapi import FastAPI, Body
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import List, Dict
 import sys
 import os
-from collections import defaultdict
+import threading
+from cachetools import TTLCache
 from datetime import datetime, timedelta
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from embeddings_engine import EmbeddingEngine
-from llm_handler import query_llm
+from llm_handler import query_llm, query_llm_stream, warmup_llm
 from prompt_templates import build_prompt
+from query_batcher import QueryBatcher
 from query_router import QueryRouter, get_aggregate_data, format_aggregate_response, build_aggregate_prompt
 from config import (HOST, PORT, TOP_K, DATA_PATH, EMBEDDING_MODEL,
                     OLLAMA_HOST, OLLAMA_PORT, USE_LLM_FOR_AGGREGATES)
-# from ollama_keepalive import keep_alive  # Disabled - caused race conditions
 
 app = FastAPI(title="Offline RAG Prototype")
 
@@ -34,45 +37,50 @@ app.add_middleware(
 # Initialize embedding engine (auto-refresh thread starts inside)
 engine = EmbeddingEngine()
 
+# Coalesces concurrent semantic queries into one encode + search
+query_batcher = QueryBatcher(engine)
+
 # Initialize query router
 query_router = QueryRouter()
 
-# Conversation history storage (session_id -> list of {role, content, timestamp})
-conversation_history = defaultdict(list)
 MAX_HISTORY_LENGTH = 10  # Keep last 10 exchanges (5 Q&A pairs)
 SESSION_TIMEOUT = timedelta(hours=1)  # Clear history after 1 hour of inactivity
+MAX_SESSIONS = 10000  # Least recently updated sessions are evicted beyond this
 
-# Keep-alive disabled - was causing race conditions with user queries
-# The lock in llm_handler.py now prevents concurrent requests
-# keep_alive.start()
-
-def clean_old_sessions():
-    """Remove conversation history for sessions that haven't been active recently."""
-    now = datetime.now()
-    sessions_to_remove = []
-    for session_id, history in conversation_history.items():
-        if history:
-            last_timestamp = history[-1].get('timestamp', now)
-            if now - last_timestamp > SESSION_TIMEOUT:
-                sessions_to_remove.append(session_id)
-    for session_id in sessions_to_remove:
-        del conversation_history[session_id]
+# Conversation history storage (session_id -> list of {role, content, timestamp}).
+# TTLCache expires inactive sessions (the TTL restarts on every write) and bounds the session count.
+conversation_history = TTLCache(maxsize=MAX_SESSIONS, ttl=SESSION_TIMEOUT.total_seconds())
+_history_lock = threading.Lock()  # TTLCache is not thread-safe; sync endpoints run in a thread pool
 
 def add_to_history(session_id: str, role: str, content: str):
     """Add a message to conversation history."""
-    clean_old_sessions()
-    conversation_history[session_id].append({
+    message = {
         'role': role,
         'content': content,
         'timestamp': datetime.now()
-    })
-    # Keep only recent history
-    if len(conversation_history[session_id]) > MAX_HISTORY_LENGTH:
-        conversation_history[session_id] = conversation_history[session_id][-MAX_HISTORY_LENGTH:]
+    }
+    with _history_lock:
+        history = conversation_history.get(session_id, [])
+        # Keep only recent history (re-assigning also restarts the session's TTL)
+        conversation_history[session_id] = (history + [message])[-MAX_HISTORY_LENGTH:]
 
 def get_conversation_context(session_id: str) -> List[Dict]:
     """Get conversation history for a session."""
-    return conversation_history.get(session_id, [])
+    with _history_lock:
+        return conversation_history.get(session_id, [])
+
+@app.on_event("startup")
+async def start_query_batcher():
+    query_batcher.start()
+
+@app.on_event("startup")
+async def warmup_ollama():
+    # Load the model into Ollama once; query_llm's keep_alive keeps it resident afterwards
+    await warmup_llm()
+
+@app.on_event("shutdown")
+async def stop_query_batcher():
+    await query_batcher.stop()
 
 @app.get("/")
 def root():
@@ -110,7 +118,7 @@ def refresh_data():
     }
 
 @app.post("/query")
-def query_endpoint(body: Dict = Body(...)):
+async def query_endpoint(body: Dict = Body(...)):
     # Accept either {"query": "..."} or raw string in "query"
     question = body.get("query") if isinstance(body, dict) else None
     session_id = body.get("session_id", "default")  # Use session_id from client or default
@@ -129,7 +137,7 @@ def query_endpoint(body: Dict = Body(...)):
             logger = logging.getLogger(__name__)
             logger.info("Lazy loading: Building index for aggregate query...")
             try:
-                count = engine.refresh_from_source()
+                count = await run_in_threadpool(engine.refresh_from_source)
                 if count > 0:
                     engine._initialized = True
                     logger.info(f"Index built with {count} records")
@@ -150,7 +158,7 @@ def query_endpoint(body: Dict = Body(...)):
             logger = logging.getLogger(__name__)
             logger.info(f"Using LLM to format aggregate response for: {subject}")
             prompt = build_aggregate_prompt(question, aggregate_data)
-            answer = query_llm(prompt, max_tokens=150, temperature=0.3)
+            answer = await query_llm(prompt, max_tokens=150, temperature=0.3)
         else:
             # Direct formatting (instant, accurate, uses templates)
             import logging
@@ -167,7 +175,7 @@ def query_endpoint(body: Dict = Body(...)):
             "query_type": "aggregate",
             "subject": subject,
             "context_count": len(engine.metadata),
-            "conversation_length": len(conversation_history[session_id]),
+            "conversation_length": len(get_conversation_context(session_id)),
             "used_llm": USE_LLM_FOR_AGGREGATES
         }
 
@@ -176,14 +184,27 @@ def query_endpoint(body: Dict = Body(...)):
         # Get conversation history for context
         conversation_context = get_conversation_context(session_id)
 
-        # Retrieve top-k relevant records
-        context_records = engine.query(question, k=TOP_K)
+        # Retrieve top-k relevant records (batched with concurrent queries, off the event loop)
+        context_records = await query_batcher.query(question, k=TOP_K)
 
         # Build prompt with conversation history
         prompt = build_prompt(question, context_records, conversation_context)
 
+        # Optional streaming: send tokens as Ollama generates them ({"stream": true})
+        if body.get("stream"):
+            async def stream_answer():
+                chunks = []
+                async for chunk in query_llm_stream(prompt):
+                    chunks.append(chunk)
+                    yield chunk
+                # Store this exchange once the full answer is known
+                add_to_history(session_id, "user", question)
+                add_to_history(session_id, "assistant", "".join(chunks).strip())
+
+            return StreamingResponse(stream_answer(), media_type="text/plain; charset=utf-8")
+
         # Get LLM response
-        llm_response = query_llm(prompt)
+        llm_response = await query_llm(prompt)
 
         # Store this exchange in conversation history
         add_to_history(session_id, "user", question)
@@ -194,15 +215,16 @@ def query_endpoint(body: Dict = Body(...)):
             "query_type": "semantic",
             "context_count": len(context_records),
             "top_context": context_records,
-            "conversation_length": len(conversation_history[session_id])
+            "conversation_length": len(get_conversation_context(session_id))
         }
 
 @app.post("/clear_history")
 def clear_history(body: Dict = Body(...)):
     """Clear conversation history for a session."""
     session_id = body.get("session_id", "default")
-    if session_id in conversation_history:
-        del conversation_history[session_id]
+    with _history_lock:
+        removed = conversation_history.pop(session_id, None)
+    if removed is not None:
         return {"message": f"Conversation history cleared for session {session_id}"}
     return {"message": "No history found for this session"}
 
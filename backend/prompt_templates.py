@@ -1,6 +1,56 @@
 # backend/prompt_templates.py
 
-from typing import List, Dict
+from itertools import islice
+from typing import List, Dict, Tuple
+
+_CONTEXT_TEMPLATE = (
+    "{software} | {server} | {location} | "
+    "license:{license} | latest:{latest_license_issued} | "
+    "day_peak:{license_day_peak} | day_avg:{license_day_average} | "
+    "work_peak:{license_work_peak} | work_avg:{license_work_average}"
+)
+
+# Values used for fields a record doesn't have
+_CONTEXT_DEFAULTS = {
+    "software": "", "server": "", "location": "", "license": "",
+    "latest_license_issued": 0, "license_day_peak": 0, "license_day_average": 0,
+    "license_work_peak": 0, "license_work_average": 0,
+}
+
+# Static prompt fragments, joined with the per-query parts in build_prompt
+_PROMPT_HEAD = "License data:\n"
+_PROMPT_HISTORY = "\nPrevious:\n"
+_PROMPT_Q = "\nQ: "
+_PROMPT_A = "\nA (2-3 sentences):"
+
+# Conversation roles included in the history, with their line prefixes
+_ROLE_PREFIXES = {"user": "User: ", "assistant": "Assistant: "}
+
+class _ContextFields(dict):
+    """Record view for _CONTEXT_TEMPLATE.format_map that fills in missing fields."""
+    __slots__ = ()
+
+    def __missing__(self, key):
+        return _CONTEXT_DEFAULTS[key]
+
+# Memoized context lines: id(record) -> (record, line). Holding the record keeps its id from
+# being reused, and the identity check guards against stale entries. Retrieval returns the same
+# record objects from the engine's metadata, so hot records are formatted only once.
+_context_line_cache: Dict[int, Tuple[Dict, str]] = {}
+_CONTEXT_LINE_CACHE_SIZE = 4096
+
+def format_context_line(r: Dict) -> str:
+    """Format a single record as a compact context line (memoized per record object)."""
+    cached = _context_line_cache.get(id(r))
+    if cached is not None and cached[0] is r:
+        return cached[1]
+
+    line = _CONTEXT_TEMPLATE.format_map(_ContextFields(r))
+    if len(_context_line_cache) >= _CONTEXT_LINE_CACHE_SIZE:
+        # Drop the oldest entry (dicts keep insertion order)
+        _context_line_cache.pop(next(iter(_context_line_cache)))
+    _context_line_cache[id(r)] = (r, line)
+    return line
 
 def build_context_snippet(records: List[Dict], max_items: int = 6) -> str:
     """
@@ -16,16 +66,7 @@ def build_context_snippet(records: List[Dict], max_items: int = 6) -> str:
     if not records:
         return "No relevant records found."
 
-    lines = []
-    for r in records[:max_items]:
-        # pick important fields
-        lines.append(
-            f"{r.get('software','')} | {r.get('server','')} | {r.get('location','')} | "
-            f"license:{r.get('license','')} | latest:{r.get('latest_license_issued',0)} | "
-            f"day_peak:{r.get('license_day_peak',0)} | day_avg:{r.get('license_day_average',0)} | "
-            f"work_peak:{r.get('license_work_peak',0)} | work_avg:{r.get('license_work_average',0)}"
-        )
-    return "\n".join(lines)
+    return "\n".join([format_context_line(r) for r in islice(records, max_items)])
 
 def build_conversation_history(history: List[Dict], max_exchanges: int = 3) -> str:
     """
@@ -44,15 +85,11 @@ def build_conversation_history(history: List[Dict], max_exchanges: int = 3) -> s
     # Take only recent exchanges (limit to avoid token overflow)
     recent = history[-(max_exchanges * 2):] if len(history) > max_exchanges * 2 else history
 
-    lines = []
-    for msg in recent:
-        role = msg.get('role', 'unknown')
-        content = msg.get('content', '')
-        if role == 'user':
-            lines.append(f"User: {content}")
-        elif role == 'assistant':
-            lines.append(f"Assistant: {content}")
-
+    lines = [
+        f"{prefix}{msg.get('content', '')}"
+        for msg in recent
+        if (prefix := _ROLE_PREFIXES.get(msg.get('role', 'unknown'))) is not None
+    ]
     return "\n".join(lines)
 
 def build_prompt(question: str, context_records: List[Dict], conversation_history: List[Dict] = None) -> str:
@@ -69,18 +106,14 @@ def build_prompt(question: str, context_records: List[Dict], conversation_histor
     """
     context = build_context_snippet(context_records)
 
+    parts = [_PROMPT_HEAD, context]
+
     # Build conversation history section (reduced to 2 exchanges for speed)
-    history_text = ""
     if conversation_history:
         history_str = build_conversation_history(conversation_history, max_exchanges=2)
         if history_str:
-            history_text = f"\nPrevious:\n{history_str}\n"
+            parts += (_PROMPT_HISTORY, history_str, "\n")
 
     # Optimized shorter prompt for faster LLM processing
-    prompt = (
-        f"License data:\n{context}"
-        f"{history_text}\n"
-        f"Q: {question}\n"
-        f"A (2-3 sentences):"
-    )
-    return prompt
+    parts += (_PROMPT_Q, question, _PROMPT_A)
+    return "".join(parts)
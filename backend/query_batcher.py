@@ -0,0 +1,74 @@
+# backend/query_batcher.py
+"""
+Micro-batching of concurrent retrieval queries.
+Requests arriving within a short window share one model encode and one FAISS search.
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from config import QUERY_BATCH_WINDOW, QUERY_BATCH_MAX
+
+logger = logging.getLogger(__name__)
+
+class QueryBatcher:
+    def __init__(self, engine, window: float = QUERY_BATCH_WINDOW, max_batch: int = QUERY_BATCH_MAX):
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background batching task (must be called from the running event loop)."""
+        if self._task is not None:
+            logger.warning("Query batcher already running")
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._batch_loop())
+        logger.info(f"Started query batcher (window={self.window * 1000:.0f}ms, max_batch={self.max_batch})")
+
+    async def stop(self):
+        """Stop the background batching task."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("Stopped query batcher")
+
+    async def query(self, q: str, k: int) -> List[Dict]:
+        """Retrieve top-k records for a query, batched with other concurrent queries."""
+        if self._task is None:
+            # Batcher not running - query directly
+            return await run_in_threadpool(self.engine.query, q, k=k)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((q, k, future))
+        return await future
+
+    async def _batch_loop(self):
+        """Collect queued queries for one window, then run them as a single batch."""
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            # Search once with the largest k; each caller gets its own top-k prefix
+            max_k = max(k for _, k, _ in batch)
+            try:
+                results = await run_in_threadpool(self.engine.query_batch, [q for q, _, _ in batch], max_k)
+            except Exception as e:
+                logger.error(f"Batched query failed: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, k, future), records in zip(batch, results):
+                if not future.done():
+                    future.set_result(records[:k])
@@ -1,8 +1,10 @@
 # backend/query_router.py
 
-from typing import List, Dict, Tuple
+from dataclasses import dataclass
+from typing import Callable, List, Dict, Optional, Tuple
 import re
 import logging
+import numpy as np
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,8 +33,47 @@ class QueryRouter:
         r'\bfetch\s+(all|the)?\s*(software|licenses|servers|locations?)',
     ]
 
+    # Aggregate subjects; the first one in the matched phrase wins, else the first in the query
+    SUBJECTS = ("software", "server", "location", "license")
+    # Single-pass scan for the earliest subject (plural forms match by prefix)
+    _SUBJECT_REGEX = re.compile('|'.join(SUBJECTS))
+
+    # Leading keyword(s) of a pattern: r'\b(list|show)\s+...' -> list, show; r'\bhow many\s+...' -> how many
+    _LEADING_KEYWORDS = re.compile(r'\\b\(?([a-z |]+)\)?\\s')
+
+    # Shorter queries can't match any aggregate pattern (shortest match: "all servers")
+    MIN_AGGREGATE_LENGTH = 8
+
     def __init__(self):
-        self.aggregate_regex = re.compile('|'.join(self.AGGREGATE_PATTERNS), re.IGNORECASE)
+        self.aggregate_keywords = self._pattern_keywords()
+        self.aggregate_regex = self._compile_aggregate_regex(self.aggregate_keywords)
+
+    @classmethod
+    def _compile_aggregate_regex(cls, keywords: Optional[Tuple[str, ...]]) -> re.Pattern:
+        """
+        Flatten AGGREGATE_PATTERNS into one regex anchored at the start of the query.
+        The leading lookahead requires a keyword as a whole word, so a non-matching query
+        fails after one scan instead of retrying every alternative at every position.
+        The matched phrase is captured as the 'aggregate' group.
+        """
+        lookahead = r'(?=.*?\b(?:%s)\b)' % '|'.join(map(re.escape, keywords)) if keywords else ''
+        alternation = '|'.join(f'(?:{p})' for p in cls.AGGREGATE_PATTERNS)
+        return re.compile(rf'\A{lookahead}.*?(?P<aggregate>{alternation})', re.IGNORECASE | re.DOTALL)
+
+    @classmethod
+    def _pattern_keywords(cls) -> Optional[Tuple[str, ...]]:
+        """
+        Collect the leading keyword of every aggregate pattern. A query that contains none
+        of them cannot match, so the regex can be skipped. Returns None (no prefilter) if
+        some pattern doesn't start with a plain keyword.
+        """
+        keywords = []
+        for pattern in cls.AGGREGATE_PATTERNS:
+            match = cls._LEADING_KEYWORDS.match(pattern)
+            if not match:
+                return None
+            keywords.extend(match.group(1).split('|'))
+        return tuple(dict.fromkeys(keywords))
 
     def classify_query(self, query: str) -> Tuple[str, str]:
         """
@@ -43,26 +84,167 @@ class QueryRouter:
             - query_type: "aggregate" or "semantic"
             - subject: "software", "server", "location", "license", or None
         """
+        if len(query) < self.MIN_AGGREGATE_LENGTH:
+            return ("semantic", None)
+
         query_lower = query.lower()
 
+        # Cheap keyword prefilter: most semantic queries never reach the regex
+        if self.aggregate_keywords is not None and not any(k in query_lower for k in self.aggregate_keywords):
+            return ("semantic", None)
+
         # Check for aggregate patterns
-        if self.aggregate_regex.search(query):
-            # Extract subject
-            if 'software' in query_lower:
-                return ("aggregate", "software")
-            elif 'server' in query_lower:
-                return ("aggregate", "server")
-            elif 'location' in query_lower:
-                return ("aggregate", "location")
-            elif 'license' in query_lower:
-                return ("aggregate", "license")
-            else:
-                return ("aggregate", None)
+        match = self.aggregate_regex.search(query_lower)
+        if match:
+            # Subject from the matched phrase ("list all servers ..."), else anywhere in the query
+            subject_match = (self._SUBJECT_REGEX.search(match.group('aggregate'))
+                             or self._SUBJECT_REGEX.search(query_lower))
+            return ("aggregate", subject_match.group(0) if subject_match else None)
 
         # Default to semantic search
         return ("semantic", None)
 
 
+# Optional Numba JIT for the aggregate scan kernels (falls back to plain NumPy)
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True)
+    def present_levels(codes: np.ndarray, n_levels: int) -> np.ndarray:
+        """Mask of levels that occur at least once in codes (-1 marks a missing value)."""
+        seen = np.zeros(n_levels, dtype=np.bool_)
+        for c in codes:
+            if c >= 0:
+                seen[c] = True
+        return seen
+else:
+    def present_levels(codes: np.ndarray, n_levels: int) -> np.ndarray:
+        """Mask of levels that occur at least once in codes (-1 marks a missing value)."""
+        seen = np.zeros(n_levels, dtype=np.bool_)
+        seen[codes[codes >= 0]] = True
+        return seen
+
+
+def _code_dtype(n_levels: int) -> type:
+    """Smallest signed integer dtype that holds codes 0..n_levels-1 and -1."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_levels <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.int64
+
+
+@dataclass
+class Column:
+    """
+    Integer-encoded categorical column: codes index into levels, -1 marks a missing value.
+    Codes use the narrowest integer type for the column's cardinality (int8 for software/location).
+    """
+    codes: np.ndarray
+    levels: np.ndarray  # sorted unique non-empty values (object dtype)
+
+    @classmethod
+    def factorize(cls, values: List) -> "Column":
+        # dict.fromkeys dedups in C, so only the distinct values get sorted
+        levels = sorted(dict.fromkeys(filter(None, values)))
+        level_index = {v: i for i, v in enumerate(levels)}
+        codes = np.fromiter((level_index.get(v, -1) for v in values),
+                            dtype=_code_dtype(len(levels)), count=len(values))
+        level_array = np.empty(len(levels), dtype=object)
+        level_array[:] = levels
+        return cls(codes=codes, levels=level_array)
+
+
+@dataclass
+class ColumnStore:
+    """
+    Struct-of-arrays view of the records for aggregate queries.
+    Each field is an integer-encoded column aligned with the record list.
+    """
+    total_records: int
+    software: Column
+    server: Column
+    location: Column
+    license: Column
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "ColumnStore":
+        columns = {
+            field: Column.factorize([r.get(field) for r in records])
+            for field in ("software", "server", "location", "license")
+        }
+        return cls(total_records=len(records), **columns)
+
+    def unique(self, field: str) -> List:
+        """Sorted unique non-empty values of a column."""
+        column = getattr(self, field)
+        return column.levels[present_levels(column.codes, len(column.levels))].tolist()
+
+    def unique_count(self, field: str) -> int:
+        """Number of unique non-empty values of a column."""
+        column = getattr(self, field)
+        return int(present_levels(column.codes, len(column.levels)).sum())
+
+
+# Column store of the most recent record list (rebuilt only when the engine swaps in new records)
+_column_store: Optional[Tuple[List[Dict], ColumnStore]] = None
+# Incremented whenever the column store is rebuilt; keys the precomputed aggregates
+_dataset_version = 0
+# Every aggregate result for the current dataset and its direct-format response:
+# (dataset_version, subject -> aggregate data, id(aggregate data) -> (aggregate data, response)).
+# Holding the data keeps its id from being reused, and the identity check guards against stale entries.
+_aggregates: Tuple[int, Dict[Optional[str], Dict], Dict[int, Tuple[Dict, str]]] = (0, {}, {})
+
+def get_column_store(records: List[Dict]) -> ColumnStore:
+    """Return the column store for a record list, building it on first use."""
+    global _column_store, _dataset_version
+    if _column_store is None or _column_store[0] is not records or _column_store[1].total_records != len(records):
+        _column_store = (records, ColumnStore.from_records(records))
+        _dataset_version += 1
+    return _column_store[1]
+
+
+def _list_handler(data_type: str, field: str) -> Callable[[ColumnStore], Dict]:
+    """Build an aggregate handler returning the unique values of one column."""
+    def handler(store: ColumnStore) -> Dict:
+        unique_items = store.unique(field)
+        return {
+            "type": data_type,
+            "count": len(unique_items),
+            "items": unique_items
+        }
+    return handler
+
+
+def _general_stats(store: ColumnStore) -> Dict:
+    """General statistics across all columns."""
+    return {
+        "type": "general_stats",
+        "total_records": store.total_records,
+        "unique_software": store.unique_count("software"),
+        "unique_servers": store.unique_count("server"),
+        "unique_locations": store.unique_count("location"),
+    }
+
+
+# Aggregate subject -> handler (unknown/None subjects get general statistics)
+_AGG_HANDLERS: Dict[str, Callable[[ColumnStore], Dict]] = {
+    "software": _list_handler("software_list", "software"),
+    "server": _list_handler("server_list", "server"),
+    "location": _list_handler("location_list", "location"),
+    "license": _list_handler("license_list", "license"),
+}
+
+
+def _precompute_aggregates(store: ColumnStore) -> Dict[Optional[str], Dict]:
+    """Compute the aggregate data for every subject; None maps to the general statistics."""
+    aggregates = {subject: handler(store) for subject, handler in _AGG_HANDLERS.items()}
+    aggregates[None] = _general_stats(store)
+    return aggregates
+
+
 def get_aggregate_data(records: List[Dict], subject: str) -> Dict:
     """
     Extract aggregate information from all records.
@@ -72,8 +254,9 @@ def get_aggregate_data(records: List[Dict], subject: str) -> Dict:
         subject: Field to aggregate (software, server, location, license)
 
     Returns:
-        Dictionary with aggregated results
+        Dictionary with aggregated results (shared across queries, treat as read-only)
     """
+    global _aggregates
     if not records or len(records) == 0:
         logger.warning("No records available for aggregate query")
         return {
@@ -81,47 +264,65 @@ def get_aggregate_data(records: List[Dict], subject: str) -> Dict:
             "message": "The system is initializing. Please wait a moment and try again."
         }
 
-    if subject == "software":
-        unique_items = set(r.get('software') for r in records if r.get('software'))
-        return {
-            "type": "software_list",
-            "count": len(unique_items),
-            "items": sorted(list(unique_items))
-        }
+    # All subjects are computed together once per dataset version, then served from memory
+    store = get_column_store(records)
+    version, aggregates, _ = _aggregates
+    if version != _dataset_version:
+        aggregates = _precompute_aggregates(store)
+        responses = {id(data): (data, _format_direct(data)) for data in aggregates.values()}
+        _aggregates = (_dataset_version, aggregates, responses)
+    return aggregates.get(subject, aggregates[None])
 
-    elif subject == "server":
-        unique_items = set(r.get('server') for r in records if r.get('server'))
-        return {
-            "type": "server_list",
-            "count": len(unique_items),
-            "items": sorted(list(unique_items))
-        }
 
-    elif subject == "location":
-        unique_items = set(r.get('location') for r in records if r.get('location'))
-        return {
-            "type": "location_list",
-            "count": len(unique_items),
-            "items": sorted(list(unique_items))
-        }
+def _numbered_lines(items: List) -> str:
+    """Render items as a 1-based numbered list, one per line."""
+    return "\n".join([f"{i}. {item}" for i, item in enumerate(items, 1)])
 
-    elif subject == "license":
-        unique_items = set(r.get('license') for r in records if r.get('license'))
-        return {
-            "type": "license_list",
-            "count": len(unique_items),
-            "items": sorted(list(unique_items))
-        }
 
-    else:
-        # General statistics
-        return {
-            "type": "general_stats",
-            "total_records": len(records),
-            "unique_software": len(set(r.get('software') for r in records if r.get('software'))),
-            "unique_servers": len(set(r.get('server') for r in records if r.get('server'))),
-            "unique_locations": len(set(r.get('location') for r in records if r.get('location'))),
-        }
+def _list_formatter(header: str) -> Callable[[Dict], str]:
+    """Build a formatter for a numbered list of unique items under a header."""
+    def formatter(aggregate_data: Dict) -> str:
+        return "".join((header.format(count=aggregate_data["count"]), _numbered_lines(aggregate_data["items"])))
+    return formatter
+
+
+def _format_license_list(aggregate_data: Dict) -> str:
+    items = aggregate_data["items"]
+    count = aggregate_data["count"]
+    # Limit license list to first 20 to avoid overwhelming response
+    return "".join((
+        f"There are {count} unique licenses in the data",
+        " (showing first 20):\n\n" if len(items) > 20 else ":\n\n",
+        _numbered_lines(items[:20]),
+    ))
+
+
+def _format_general_stats(aggregate_data: Dict) -> str:
+    return (
+        f"Database Statistics:\n"
+        f"- Total Records: {aggregate_data['total_records']}\n"
+        f"- Unique Software: {aggregate_data['unique_software']}\n"
+        f"- Unique Servers: {aggregate_data['unique_servers']}\n"
+        f"- Unique Locations: {aggregate_data['unique_locations']}"
+    )
+
+
+# Aggregate data type -> direct (non-LLM) response formatter
+_FORMATTERS: Dict[str, Callable[[Dict], str]] = {
+    "software_list": _list_formatter("There are {count} unique software products in the license data:\n\n"),
+    "server_list": _list_formatter("There are {count} unique license servers:\n\n"),
+    "location_list": _list_formatter("There are {count} unique locations:\n\n"),
+    "license_list": _format_license_list,
+    "general_stats": _format_general_stats,
+}
+
+
+def _format_direct(aggregate_data: Dict) -> str:
+    """Format aggregate data with the formatter for its type (no LLM)."""
+    formatter = _FORMATTERS.get(aggregate_data.get("type"))
+    if formatter is None:
+        return "Unable to format aggregate data."
+    return formatter(aggregate_data)
 
 
 def format_aggregate_response(aggregate_data: Dict, query: str, use_llm: bool = False) -> str:
@@ -142,54 +343,17 @@ def format_aggregate_response(aggregate_data: Dict, query: str, use_llm: bool =
             return f"{error_msg}\n\n{aggregate_data['message']}"
         return error_msg
 
-    data_type = aggregate_data.get("type")
-
     # If use_llm is True, return raw data structure for LLM processing
     if use_llm:
         return aggregate_data
 
-    # Default: Direct formatting (fast, accurate)
-    if data_type == "software_list":
-        items = aggregate_data["items"]
-        count = aggregate_data["count"]
-        return f"There are {count} unique software products in the license data:\n\n" + \
-               "\n".join(f"{i+1}. {item}" for i, item in enumerate(items))
-
-    elif data_type == "server_list":
-        items = aggregate_data["items"]
-        count = aggregate_data["count"]
-        return f"There are {count} unique license servers:\n\n" + \
-               "\n".join(f"{i+1}. {item}" for i, item in enumerate(items))
-
-    elif data_type == "location_list":
-        items = aggregate_data["items"]
-        count = aggregate_data["count"]
-        return f"There are {count} unique locations:\n\n" + \
-               "\n".join(f"{i+1}. {item}" for i, item in enumerate(items))
-
-    elif data_type == "license_list":
-        items = aggregate_data["items"]
-        count = aggregate_data["count"]
-        # Limit license list to first 20 to avoid overwhelming response
-        display_items = items[:20]
-        response = f"There are {count} unique licenses in the data"
-        if len(items) > 20:
-            response += f" (showing first 20):\n\n"
-        else:
-            response += ":\n\n"
-        response += "\n".join(f"{i+1}. {item}" for i, item in enumerate(display_items))
-        return response
-
-    elif data_type == "general_stats":
-        return (
-            f"Database Statistics:\n"
-            f"- Total Records: {aggregate_data['total_records']}\n"
-            f"- Unique Software: {aggregate_data['unique_software']}\n"
-            f"- Unique Servers: {aggregate_data['unique_servers']}\n"
-            f"- Unique Locations: {aggregate_data['unique_locations']}"
-        )
+    # Aggregates served by get_aggregate_data come with their response preformatted
+    cached = _aggregates[2].get(id(aggregate_data))
+    if cached is not None and cached[0] is aggregate_data:
+        return cached[1]
 
-    return "Unable to format aggregate data."
+    # Default: Direct formatting (fast, accurate)
+    return _format_direct(aggregate_data)
 
 
 def build_aggregate_prompt(query: str, aggregate_data: Dict) -> str:
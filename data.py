@@ -1,27 +1,73 @@
-import json, random
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+N = 10000
+rng = np.random.default_rng(0)
 
 softwares = ["Autodesk", "MATLAB", "SolidWorks", "CATIA", "ANSYS", "Revit", "Fusion360", "Creo", "Maya", "3dsMax"]
 locations = ["India", "USA", "Germany", "Japan", "UK", "France", "Australia"]
-servers = [f"27000@SRV{i:05}" for i in range(10000)]
-
-data = []
-for i in range(10000):
-    record = {
-        "software": random.choice(softwares),
-        "server": random.choice(servers),
-        "location": random.choice(locations),
-        "license": f"{random.randint(80000, 99999)}{random.choice(['ACAD', 'REV', 'SOLID', 'CAT', 'MAYA'])}_E_{random.randint(2018,2024)}_0F",
-        "latest_license_issued": random.randint(1, 50),
-        "license_day_peak": random.randint(1, 10),
-        "license_day_average": random.randint(1, 10),
-        "license_work_peak": random.randint(1, 10),
-        "license_work_average": random.randint(1, 10),
-        "percentage_work_peak": random.randint(10, 100),
-        "percentage_work_average": random.randint(5, 90)
-    }
-    data.append(record)
-
-with open("license_data_sample.json", "w") as f:
-    json.dump(data, f, indent=2)
+servers = np.char.add('27000@SRV', np.char.zfill(np.arange(10000).astype('U5'), 5)).tolist()
+
+# Draw every column in one vectorized call (upper bounds are exclusive)
+software_col = rng.choice(softwares, size=N).tolist()
+server_col = rng.choice(servers, size=N).tolist()
+location_col = rng.choice(locations, size=N).tolist()
+license_num = rng.integers(80000, 100000, size=N).astype('U5')
+license_suffix = rng.choice(['ACAD', 'REV', 'SOLID', 'CAT', 'MAYA'], size=N)
+license_year = rng.integers(2018, 2025, size=N).astype('U4')
+# "{num}{suffix}_E_{year}_0F" assembled column-wise
+licenses = np.char.add(license_num, license_suffix)
+licenses = np.char.add(licenses, '_E_')
+licenses = np.char.add(licenses, license_year)
+licenses = np.char.add(licenses, '_0F').tolist()
+latest_issued = rng.integers(1, 51, size=N).tolist()
+day_peak = rng.integers(1, 11, size=N).tolist()
+day_average = rng.integers(1, 11, size=N).tolist()
+work_peak = rng.integers(1, 11, size=N).tolist()
+work_average = rng.integers(1, 11, size=N).tolist()
+pct_work_peak = rng.integers(10, 101, size=N).tolist()
+pct_work_average = rng.integers(5, 91, size=N).tolist()
+
+
+def generate_records():
+    """Yield one record dict at a time from the column arrays."""
+    for sw, srv, loc, lic, latest, dp, da, wp, wa, pwp, pwa in zip(
+        software_col, server_col, location_col, licenses, latest_issued,
+        day_peak, day_average, work_peak, work_average, pct_work_peak, pct_work_average
+    ):
+        yield {
+            "software": sw,
+            "server": srv,
+            "location": loc,
+            "license": lic,
+            "latest_license_issued": latest,
+            "license_day_peak": dp,
+            "license_day_average": da,
+            "license_work_peak": wp,
+            "license_work_average": wa,
+            "percentage_work_peak": pwp,
+            "percentage_work_average": pwa
+        }
+
+
+if orjson is not None:
+    dumps = orjson.dumps
+else:
+    def dumps(record):
+        return json.dumps(record, separators=(',', ':')).encode()
+
+# Stream the array one record per line so the full list of dicts never sits in memory
+with open("license_data_sample.json", "wb") as f:
+    f.write(b"[\n")
+    for i, record in enumerate(generate_records()):
+        if i:
+            f.write(b",\n")
+        f.write(dumps(record))
+    f.write(b"\n]\n")
 
 print("✅ Sample dataset with 10,000 records created: license_data_sample.json")